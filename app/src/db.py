@@ -18,7 +18,7 @@ engine = create_engine(DATABASE_URL, echo=True)
 def create_db_and_tables():
     """Создает таблицы в базе данных на основе моделей SQLModel."""
     # Импортируем модели, чтобы они были известны SQLModel
-    from .models import User, Chat, Message
+    from .models import User, Chat, Message, ChatDailyStats
     
     SQLModel.metadata.create_all(engine)
 
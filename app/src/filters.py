@@ -0,0 +1,68 @@
+from typing import Optional
+import re
+from worker.src.extractor import CATEGORIES, CURRENCY_CODES, DEFAULT_CURRENCY, KEYWORDS, multiplier_value, normalize_term
+
+# Обозначения валюты в фильтрах /report и /find (токен должен совпадать целиком)
+CURRENCY_TOKENS = {
+    **{code.lower(): code for code in CURRENCY_CODES.values()},
+    **CURRENCY_CODES,
+    "руб.": "RUB", "р.": "RUB", "рубль": "RUB", "рублей": "RUB",
+    "доллар": "USD", "долларов": "USD",
+}
+
+# Сумма фильтра: "50000", "50к", "50k", "1,5млн"
+AMOUNT_FILTER = r"(\d+(?:[.,]\d+)?)(к|k|тыс|млн)?"
+
+def parse_amount(value: str) -> int:
+    """Разбирает сумму фильтра: "50000", "50к", "50k", "1,5млн"."""
+    match = re.fullmatch(AMOUNT_FILTER, value.strip().lower())
+    if not match:
+        raise ValueError(f"Некорректная сумма: {value}")
+    return round(float(match.group(1).replace(",", ".")) * multiplier_value(match.group(2)))
+
+def parse_report_filters(args: Optional[str]) -> dict:
+    """
+    Разбирает фильтры для /report и /find.
+    Пример: "iphone <50000 RUB", "диван 5000-20000", "phone >10к".
+    Диапазон цены: "мин-макс", "<макс", ">мин"; валюта: RUB, USD, EUR, KZT, руб, $, €;
+    остальное - категория или ключевое слово (например, "айфон" -> iphone).
+    Цена без валюты сравнивается в валюте по умолчанию (RUB): суммы в разных
+    валютах между собой не сравнимы.
+    """
+    filters = {}
+
+    for token in (args or "").split():
+        lowered = token.lower()
+        range_match = re.fullmatch(rf"({AMOUNT_FILTER})-({AMOUNT_FILTER})", lowered)
+        if range_match:
+            filters["min_price"] = parse_amount(range_match.group(1))
+            filters["max_price"] = parse_amount(range_match.group(4))
+        elif token.startswith("<"):
+            filters["max_price"] = parse_amount(token[1:])
+        elif token.startswith(">"):
+            filters["min_price"] = parse_amount(token[1:])
+        elif lowered in CURRENCY_TOKENS:
+            filters["currency"] = CURRENCY_TOKENS[lowered]
+        elif "category" in filters or "keyword" in filters:
+            raise ValueError("Укажите только одну категорию или ключевое слово.")
+        else:
+            term = normalize_term(token)
+            if term in CATEGORIES:
+                filters["category"] = term
+            elif term in KEYWORDS:
+                filters["keyword"] = term
+            else:
+                raise ValueError(
+                    f"Неизвестный товар «{token}». "
+                    f"Категории: {', '.join(CATEGORIES)}. "
+                    f"Ключевые слова: {', '.join(KEYWORDS)}."
+                )
+
+    if filters.get("min_price") is not None and filters.get("max_price") is not None \
+            and filters["min_price"] > filters["max_price"]:
+        raise ValueError("Минимальная цена больше максимальной.")
+
+    if ("min_price" in filters or "max_price" in filters) and "currency" not in filters:
+        filters["currency"] = DEFAULT_CURRENCY
+
+    return filters
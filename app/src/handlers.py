@@ -1,14 +1,17 @@
 from aiogram import Router, types, F
-from aiogram.filters import CommandStart, Command, ChatMemberUpdatedFilter, IS_NOT_MEMBER, IS_MEMBER
+from aiogram.filters import CommandStart, Command, CommandObject, ChatMemberUpdatedFilter, IS_NOT_MEMBER, IS_MEMBER
 from aiogram.types import Message, CallbackQuery, ChatMemberUpdated, InlineKeyboardMarkup, InlineKeyboardButton
 from sqlmodel import Session, select
 from .db import engine
 from .models import User, Chat
-from .reports import generate_excel_report
+from .reports import generate_excel_report, generate_stats_summary, find_sale_messages
+from .filters import parse_report_filters
 from .telegram_utils import is_bot_admin
-from typing import Optional, List
-from datetime import datetime
+from typing import Optional, List, Tuple
+from datetime import date, datetime, timedelta
+import os
 from worker.src.tasks import process_message # Импортируем задачу Celery напрямую
+from worker.src.payload import build_task_payload, payload_repr, store_large_text
 
 router = Router()
 
@@ -43,6 +46,33 @@ def get_chat_by_tg_id(tg_chat_id: int) -> Optional[Chat]:
         statement = select(Chat).where(Chat.telegram_chat_id == tg_chat_id)
         return session.exec(statement).first()
 
+def parse_stats_period(args: Optional[str]) -> Tuple[date, date]:
+    """
+    Разбирает период для /stats.
+    Без аргументов - последние 7 дней; "30" - последние 30 дней;
+    "2024-01-01 2024-01-31" - явный диапазон дат.
+    """
+    today = datetime.utcnow().date()
+    parts = (args or "").split()
+
+    if not parts:
+        return today - timedelta(days=6), today
+
+    if len(parts) == 1 and parts[0].isdigit():
+        days = int(parts[0])
+        if days < 1:
+            raise ValueError("Количество дней должно быть положительным.")
+        return today - timedelta(days=days - 1), today
+
+    if len(parts) == 2:
+        start_date = date.fromisoformat(parts[0])
+        end_date = date.fromisoformat(parts[1])
+        if start_date > end_date:
+            raise ValueError("Начало периода позже его конца.")
+        return start_date, end_date
+
+    raise ValueError("Используйте /stats, /stats <дней> или /stats <ГГГГ-ММ-ДД> <ГГГГ-ММ-ДД>.")
+
 # ----------------------------------------------------------------------
 # Обработчики команд
 # ----------------------------------------------------------------------
@@ -101,8 +131,8 @@ async def command_chats_handler(message: Message) -> None:
 
 
 @router.message(Command("report"))
-async def command_report_handler(message: Message) -> None:
-    """Обрабатывает команду /report (формирование отчета)."""
+async def command_report_handler(message: Message, command: CommandObject) -> None:
+    """Обрабатывает команду /report [фильтры] (формирование отчета)."""
     tg_user_id = message.from_user.id
     user = get_user_by_tg_id(tg_user_id)
     
@@ -112,7 +142,8 @@ async def command_report_handler(message: Message) -> None:
 
     try:
         # Генерация отчета
-        excel_bytes = generate_excel_report(user_id=user.telegram_user_id)
+        filters = parse_report_filters(command.args)
+        excel_bytes = generate_excel_report(user_id=user.telegram_user_id, filters=filters)
         
         # Отправка файла
         excel_file = types.BufferedInputFile(excel_bytes, filename="sales_report.xlsx")
@@ -126,6 +157,51 @@ async def command_report_handler(message: Message) -> None:
     except Exception as e:
         await message.answer(f"Произошла ошибка при генерации отчета: {e}")
 
+@router.message(Command("find"))
+async def command_find_handler(message: Message, command: CommandObject) -> None:
+    """Обрабатывает команду /find <фильтры> (поиск объявлений по цене и категории)."""
+    tg_user_id = message.from_user.id
+    user = get_user_by_tg_id(tg_user_id)
+    
+    if not user:
+        await message.answer("Пожалуйста, сначала зарегистрируйтесь, используя команду /start.")
+        return
+
+    try:
+        filters = parse_report_filters(command.args)
+        if not filters:
+            await message.answer(
+                "Укажите условия поиска, например: /find iphone <50000 или /find диван 5000-20000 RUB"
+            )
+            return
+
+        await message.answer(find_sale_messages(user.telegram_user_id, filters))
+
+    except ValueError as e:
+        await message.answer(f"Не удалось выполнить поиск: {e}")
+    except Exception as e:
+        await message.answer(f"Произошла ошибка при поиске: {e}")
+
+@router.message(Command("stats"))
+async def command_stats_handler(message: Message, command: CommandObject) -> None:
+    """Обрабатывает команду /stats (сводка по агрегированной статистике)."""
+    tg_user_id = message.from_user.id
+    user = get_user_by_tg_id(tg_user_id)
+    
+    if not user:
+        await message.answer("Пожалуйста, сначала зарегистрируйтесь, используя команду /start.")
+        return
+
+    try:
+        start_date, end_date = parse_stats_period(command.args)
+        text = generate_stats_summary(user.telegram_user_id, start_date, end_date)
+        await message.answer(text, parse_mode="Markdown")
+
+    except ValueError as e:
+        await message.answer(f"Не удалось сформировать статистику: {e}")
+    except Exception as e:
+        await message.answer(f"Произошла ошибка при формировании статистики: {e}")
+
 # ----------------------------------------------------------------------
 # Обработчик добавления/удаления бота из чата (MyChatMember)
 # ----------------------------------------------------------------------
@@ -238,32 +314,38 @@ async def handle_group_message(message: Message) -> None:
     # 2. Собираем данные для воркера
     text = message.text or message.caption or ""
     
-    # Собираем информацию о медиафайлах
+    # Собираем информацию о медиафайлах: [file_unique_id, file_id, размер, расширение]
     media_files = []
     if message.photo:
         # Берем самое большое фото
-        file_id = message.photo[-1].file_id
-        media_files.append({"file_id": file_id, "file_extension": ".jpg"})
+        photo = message.photo[-1]
+        media_files.append([photo.file_unique_id, photo.file_id, photo.file_size or 0, ".jpg"])
     elif message.video:
-        file_id = message.video.file_id
-        media_files.append({"file_id": file_id, "file_extension": ".mp4"})
+        video = message.video
+        media_files.append([video.file_unique_id, video.file_id, video.file_size or 0, ".mp4"])
     elif message.document:
-        file_id = message.document.file_id
-        file_name = message.document.file_name or ""
+        document = message.document
+        file_name = document.file_name or ""
         ext = os.path.splitext(file_name)[1] or ".bin"
-        media_files.append({"file_id": file_id, "file_extension": ext})
+        media_files.append([document.file_unique_id, document.file_id, document.file_size or 0, ext])
+
+    # Для нескольких владельцев длинный текст кладем в Redis один раз и передаем задачам ссылку
+    text_ref = store_large_text(tg_chat_id, message.message_id, text, consumers=len(enabled_chats))
 
     # 3. Отправляем задачу в Celery для каждого владельца, включившего парсинг
     for chat_entry in enabled_chats:
         # Отправляем задачу в очередь
-        process_message.delay(
+        payload = build_task_payload(
             chat_id=tg_chat_id,
+            owner_id=chat_entry.owner_id,
             message_id=message.message_id,
             author_id=message.from_user.id,
+            timestamp=message.date,
             text=text,
-            timestamp=datetime.fromtimestamp(message.date).isoformat(),
-            media_files=media_files
+            media_files=media_files,
+            text_ref=text_ref
         )
+        process_message.apply_async((payload,), argsrepr=payload_repr(payload))
         
         print(f"Task sent to Celery for chat {tg_chat_id} (Owner: {chat_entry.owner_id})")
 
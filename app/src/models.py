@@ -1,6 +1,9 @@
-from datetime import datetime
+from datetime import date, datetime
+from decimal import Decimal
 from typing import Optional, List
 from sqlmodel import Field, SQLModel, Relationship
+from sqlalchemy import Column, Index, String, UniqueConstraint
+from sqlalchemy.dialects.postgresql import ARRAY
 
 # ----------------------------------------------------------------------
 # Core Models
@@ -56,12 +59,21 @@ class Message(SQLModel, table=True):
     chat_id: int = Field(foreign_key="chat.id") # Связь с записью чата в нашей БД
     author_telegram_user_id: int # ID автора сообщения в Telegram
     text: Optional[str] = None
-    timestamp: datetime
+    timestamp: datetime = Field(index=True)
     
     # Результаты классификации
     is_sale_message: bool = Field(default=False)
     nlp_check: bool = Field(default=False)
     llm_check: bool = Field(default=False)
+    # LLM была недоступна: результат предварительный (только NLP), ждет повторной LLM-проверки
+    llm_pending: bool = Field(default=False, index=True)
+
+    # Структурированные данные объявления (src/extractor.py воркера)
+    price: Optional[Decimal] = Field(default=None, max_digits=14, decimal_places=2)
+    currency: Optional[str] = Field(default=None, max_length=3) # ISO-код: RUB, USD, EUR, KZT
+    category: Optional[str] = None # Нормализованная категория: phone, laptop, auto, ...
+    # Нормализованные ключевые слова (iphone, sofa, ...); NULL - извлечение еще не выполнялось
+    keywords: Optional[List[str]] = Field(default=None, sa_column=Column(ARRAY(String)))
     
     # Путь к медиа (локальное хранение)
     media_path: Optional[str] = None # Путь к папке /storage/{user_id}/{chat_id}/{message_id}/
@@ -76,6 +88,50 @@ class Message(SQLModel, table=True):
         {"unique_together": ("telegram_message_id", "chat_id")}
     )
 
+# Индексы для фильтрованных отчетов: фильтры по цене и категории
+# выполняются в SQL по диапазонам индексов, а не перебором всех продаж
+# (отчеты всегда ограничены чатами владельца и только продажами)
+Index(
+    "ix_message_chat_price",
+    Message.chat_id, Message.price,
+    postgresql_where=Message.is_sale_message
+)
+Index(
+    "ix_message_category_chat_price",
+    Message.category, Message.chat_id, Message.price,
+    postgresql_where=Message.is_sale_message
+)
+Index("ix_message_keywords", Message.keywords, postgresql_using="gin")
+
+# ----------------------------------------------------------------------
+# Rollup Models
+# ----------------------------------------------------------------------
+
+class ChatDailyStats(SQLModel, table=True):
+    """
+    Агрегированная статистика по сообщениям: одна строка на (владелец, чат, день).
+    Обновляется воркером инкрементально при сохранении сообщения и периодически
+    пересчитывается за последние дни. Команда /stats читает только эту таблицу,
+    не сканируя Message.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    owner_id: int = Field(foreign_key="user.telegram_user_id", index=True)
+    chat_id: int = Field(foreign_key="chat.id") # Связь с записью чата в нашей БД
+    day: date
+
+    total_count: int = Field(default=0)
+    sale_count: int = Field(default=0)
+    nlp_count: int = Field(default=0)
+    llm_count: int = Field(default=0)
+    # Сообщения с предварительным результатом (ждут LLM-проверки) и продажи среди них
+    pending_count: int = Field(default=0)
+    pending_sale_count: int = Field(default=0)
+
+    # Уникальность по тройке (owner_id, chat_id, day) - нужна для UPSERT
+    __table_args__ = (
+        UniqueConstraint("owner_id", "chat_id", "day", name="uq_chatdailystats_owner_chat_day"),
+    )
+
 # ----------------------------------------------------------------------
 # Database Setup
 # ----------------------------------------------------------------------
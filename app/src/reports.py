@@ -1,13 +1,48 @@
 import pandas as pd
 from sqlmodel import Session, select
 from .db import engine
-from .models import Message, Chat
-from datetime import datetime
-from typing import List
+from sqlalchemy import func
+from sqlalchemy.sql import Select
+from .models import Message, Chat, ChatDailyStats
+from datetime import date, datetime
+from typing import List, Optional
 
-def generate_excel_report(user_id: int, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> bytes:
+# Максимум сообщений в ответе /find
+FIND_LIMIT = 20
+# Длина текста объявления в ответе /find
+FIND_TEXT_LENGTH = 150
+# Ограничение Telegram на длину текстового сообщения
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+def apply_message_filters(statement: Select, filters: Optional[dict]) -> Select:
+    """
+    Добавляет в запрос фильтры по цене, валюте, категории и ключевому слову.
+    Фильтры выполняются в SQL по индексам Message (B-tree по цене, GIN по keywords).
+    """
+    if not filters:
+        return statement
+
+    if filters.get("min_price") is not None:
+        statement = statement.where(Message.price >= filters["min_price"])
+    if filters.get("max_price") is not None:
+        statement = statement.where(Message.price <= filters["max_price"])
+    if filters.get("currency"):
+        statement = statement.where(Message.currency == filters["currency"])
+    if filters.get("category"):
+        statement = statement.where(Message.category == filters["category"])
+    if filters.get("keyword"):
+        statement = statement.where(Message.keywords.contains([filters["keyword"]]))
+    return statement
+
+def generate_excel_report(
+    user_id: int,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    filters: Optional[dict] = None
+) -> bytes:
     """
     Генерирует Excel-отчет для пользователя.
+    filters - необязательные фильтры по цене/категории (см. apply_message_filters).
     Возвращает байты файла Excel.
     """
     with Session(engine) as session:
@@ -30,11 +65,12 @@ def generate_excel_report(user_id: int, start_date: Optional[datetime] = None, e
             message_statement = message_statement.where(Message.timestamp >= start_date)
         if end_date:
             message_statement = message_statement.where(Message.timestamp <= end_date)
+        message_statement = apply_message_filters(message_statement, filters)
             
         messages: List[Message] = session.exec(message_statement).all()
         
         if not messages:
-            raise ValueError("Не найдено сообщений о продаже за указанный период.")
+            raise ValueError("Не найдено сообщений о продаже по заданным условиям.")
 
         # 3. Подготовка данных для DataFrame
         data = []
@@ -45,9 +81,12 @@ def generate_excel_report(user_id: int, start_date: Optional[datetime] = None, e
                 "Дата": msg.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
                 "Чат": chat_titles.get(msg.chat_id, "Неизвестный чат"),
                 "Текст сообщения": msg.text,
+                "Цена": float(msg.price) if msg.price is not None else None,
+                "Валюта": msg.currency,
+                "Категория": msg.category,
                 "Автор (TG ID)": msg.author_telegram_user_id,
                 "Продажа (NLP)": "Да" if msg.nlp_check else "Нет",
-                "Продажа (LLM)": "Да" if msg.llm_check else "Нет",
+                "Продажа (LLM)": "ожидает проверки" if msg.llm_pending else ("Да" if msg.llm_check else "Нет"),
                 "Путь к медиа": msg.media_path if msg.media_path else "Нет"
             })
             
@@ -62,5 +101,95 @@ def generate_excel_report(user_id: int, start_date: Optional[datetime] = None, e
         
         return output.getvalue()
 
+def find_sale_messages(user_id: int, filters: dict, limit: int = FIND_LIMIT) -> str:
+    """
+    Возвращает текстовый список последних сообщений о продаже, подходящих под фильтры.
+    Объявления добавляются, пока ответ укладывается в ограничение Telegram на длину сообщения.
+    """
+    with Session(engine) as session:
+        statement = select(Message, Chat.title).join(Chat, Chat.id == Message.chat_id).where(
+            Chat.owner_id == user_id,
+            Message.is_sale_message == True
+        ).order_by(Message.timestamp.desc()).limit(limit)
+        statement = apply_message_filters(statement, filters)
+
+        rows = session.exec(statement).all()
+
+    if not rows:
+        raise ValueError("Не найдено сообщений о продаже по заданным условиям.")
+
+    lines = []
+    length = 0
+    for msg, title in rows:
+        price = f"{msg.price:,.0f} {msg.currency}".replace(",", " ") if msg.price is not None else "цена не указана"
+        text = (msg.text or "").replace("\n", " ")
+        if len(text) > FIND_TEXT_LENGTH:
+            text = text[:FIND_TEXT_LENGTH] + "…"
+        line = f"{msg.timestamp:%d.%m.%Y} · {(title or 'Неизвестный чат')[:100]} · {price}\n{text}"
+
+        # Запас под строку о неполном списке
+        if length + len(line) + 2 > TELEGRAM_MESSAGE_LIMIT - 100:
+            break
+        lines.append(line)
+        length += len(line) + 2
+
+    if len(lines) < len(rows):
+        lines.append(f"Показаны {len(lines)} последних объявлений, уточните условия поиска.")
+    return "\n\n".join(lines)
+
+def generate_stats_summary(user_id: int, start_date: date, end_date: date) -> str:
+    """
+    Формирует текстовую сводку по агрегированной статистике за период.
+    Читает только таблицу ChatDailyStats, сырые сообщения не сканируются.
+    """
+    with Session(engine) as session:
+        statement = select(
+            Chat.title,
+            func.sum(ChatDailyStats.total_count),
+            func.sum(ChatDailyStats.sale_count),
+            func.sum(ChatDailyStats.nlp_count),
+            func.sum(ChatDailyStats.llm_count),
+            func.sum(ChatDailyStats.pending_count),
+            func.sum(ChatDailyStats.pending_sale_count)
+        ).join(Chat, Chat.id == ChatDailyStats.chat_id).where(
+            ChatDailyStats.owner_id == user_id,
+            ChatDailyStats.day >= start_date,
+            ChatDailyStats.day <= end_date
+        ).group_by(Chat.id, Chat.title).order_by(func.sum(ChatDailyStats.sale_count).desc())
+
+        rows = session.exec(statement).all()
+
+    if not rows:
+        raise ValueError("Нет данных за указанный период.")
+
+    text = f"Статистика за {start_date:%d.%m.%Y} — {end_date:%d.%m.%Y}:\n\n"
+    totals = [0, 0, 0, 0, 0, 0]
+
+    for title, *counts in rows:
+        text += f"**{title or 'Неизвестный чат'}**\n{_format_counts(*counts)}\n\n"
+        totals = [acc + value for acc, value in zip(totals, counts)]
+
+    text += f"**Итого:** {_format_counts(*totals)}"
+    return text
+
+def _format_counts(total: int, sale: int, nlp: int, llm: int, pending: int, pending_sale: int) -> str:
+    """Строки сводки /stats по счетчикам одного чата или итога."""
+    text = f"Сообщений: {total}, продаж: {sale} (NLP: {nlp}, LLM: {llm})"
+    if pending:
+        text += f", ожидают проверки LLM: {pending}"
+    return text + f"\nСогласие NLP/LLM: {_agreement_rate(total, sale, nlp, llm, pending, pending_sale)}"
+
+def _agreement_rate(total: int, sale: int, nlp: int, llm: int, pending: int = 0, pending_sale: int = 0) -> str:
+    """
+    Доля сообщений, где NLP и LLM дали одинаковый ответ.
+    Продажа = NLP или LLM, поэтому число расхождений равно 2 * sale - nlp - llm.
+    Сообщения, ждущие LLM-проверки (llm_check = False, продажа = NLP), не учитываются:
+    каждая предварительная продажа добавила бы в формулу одно ложное расхождение.
+    """
+    checked = total - pending
+    if not checked:
+        return "нет данных"
+    disagreements = 2 * sale - nlp - llm - pending_sale
+    return f"{(checked - disagreements) / checked:.1%}"
+
 import io
-from typing import Optional
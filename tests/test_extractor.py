@@ -0,0 +1,69 @@
+from decimal import Decimal
+import pytest
+from worker.src.extractor import extract_item, extract_items
+
+@pytest.mark.parametrize("text, price, currency", [
+    ("Продам диван 15 000 руб", Decimal("15000"), "RUB"),
+    ("50 000 рублей, торг", Decimal("50000"), "RUB"),
+    ("1.500.000 р. машина", Decimal("1500000"), "RUB"),
+    ("Телефон 12000₽", Decimal("12000"), "RUB"),
+    ("цена 1,5 тыс. р.", Decimal("1500"), "RUB"),
+    ("Квартира 5,5 млн руб", Decimal("5500000"), "RUB"),
+    ("цена: 50к", Decimal("50000"), "RUB"),
+    ("$500 за PS5", Decimal("500"), "USD"),
+    ("€ 1 200 ноутбук", Decimal("1200"), "EUR"),
+    ("Велосипед 30000 тенге", Decimal("30000"), "KZT"),
+    # Запятая с тремя цифрами после нее - разделитель разрядов
+    ("$1,500", Decimal("1500"), "USD"),
+    ("1,500 руб", Decimal("1500"), "RUB"),
+    ("2,500 USD", Decimal("2500"), "USD"),
+    ("1,500,000 р.", Decimal("1500000"), "RUB"),
+    ("1 500,50 руб", Decimal("1500.5"), "RUB"),
+    ("1.500,5 €", Decimal("1500.5"), "EUR"),
+    # Тысячи рублей одним обозначением
+    ("Гараж за 150 т.р.", Decimal("150000"), "RUB"),
+    ("150 т.р", Decimal("150000"), "RUB"),
+    ("150 тр, торг", Decimal("150000"), "RUB"),
+    ("Продам трактор 500 руб", Decimal("500"), "RUB"),
+    # Номер модели после латинского слова - не разряды цены
+    ("Продам iPhone 13 500 руб", Decimal("500"), "RUB"),
+    ("Xbox 360 2 000 руб", Decimal("2000"), "RUB"),
+])
+def test_price(text, price, currency):
+    item = extract_item(text)
+    assert item["price"] == price
+    assert item["currency"] == currency
+
+@pytest.mark.parametrize("text", [
+    "Продаю рубашку 3 шт",
+    "Куплю PS5",
+    "нет цены",
+    "",
+    None,
+])
+def test_no_price(text):
+    item = extract_item(text)
+    assert item["price"] is None
+    assert item["currency"] is None
+
+@pytest.mark.parametrize("text, category, keywords", [
+    ("Продам айфон", "phone", ["iphone"]),
+    ("Детская коляска и игрушки", "kids", ["stroller", "toys"]),
+    ("Машина в хорошем состоянии", "auto", ["car"]),
+    ("Зимние шины R16", "auto", ["tires"]),
+    ("Просто сообщение", None, []),
+])
+def test_category(text, category, keywords):
+    item = extract_item(text)
+    assert item["category"] == category
+    assert item["keywords"] == keywords
+
+def test_batch_matches_single():
+    texts = [
+        "Продам iPhone 13 500 руб", "Квартира 5,5 млн руб", "$500 за PS5",
+        "Продаю рубашку 3 шт", "диван 15 000 руб", "$1,500", "Гараж за 150 т.р.", None, "",
+    ]
+    assert extract_items(texts) == [extract_item(text) for text in texts]
+
+def test_batch_empty():
+    assert extract_items([]) == []
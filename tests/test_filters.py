@@ -0,0 +1,49 @@
+import pytest
+from app.src.filters import parse_amount, parse_report_filters
+
+@pytest.mark.parametrize("value, amount", [
+    ("50000", 50000),
+    ("50к", 50000),
+    ("50k", 50000),
+    ("10тыс", 10000),
+    ("1,5млн", 1500000),
+])
+def test_parse_amount(value, amount):
+    assert parse_amount(value) == amount
+
+@pytest.mark.parametrize("value", ["", "abc", "50кк", "-5"])
+def test_parse_amount_invalid(value):
+    with pytest.raises(ValueError):
+        parse_amount(value)
+
+@pytest.mark.parametrize("args, filters", [
+    (None, {}),
+    ("", {}),
+    ("iphone <50000 RUB", {"keyword": "iphone", "max_price": 50000, "currency": "RUB"}),
+    ("Айфон >10к", {"keyword": "iphone", "min_price": 10000, "currency": "RUB"}),
+    ("диван 5000-20000", {"keyword": "sofa", "min_price": 5000, "max_price": 20000, "currency": "RUB"}),
+    ("phone 1к-2к usd", {"category": "phone", "min_price": 1000, "max_price": 2000, "currency": "USD"}),
+    ("квартира <5млн руб", {"keyword": "apartment", "max_price": 5000000, "currency": "RUB"}),
+    ("realty $", {"category": "realty", "currency": "USD"}),
+    ("auto ₸", {"category": "auto", "currency": "KZT"}),
+    # Без цены валюта не подставляется
+    ("iphone", {"keyword": "iphone"}),
+])
+def test_parse_report_filters(args, filters):
+    assert parse_report_filters(args) == filters
+
+def test_currency_requires_exact_token():
+    # "рубашка" начинается с "руб", но валютой не является
+    with pytest.raises(ValueError, match="Неизвестный товар"):
+        parse_report_filters("рубашка")
+
+def test_unknown_term_lists_supported():
+    with pytest.raises(ValueError) as error:
+        parse_report_filters("пылесос")
+    assert "phone" in str(error.value)
+    assert "iphone" in str(error.value)
+
+@pytest.mark.parametrize("args", ["iphone диван", "5000-100", "<abc"])
+def test_parse_report_filters_invalid(args):
+    with pytest.raises(ValueError):
+        parse_report_filters(args)
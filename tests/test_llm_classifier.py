@@ -0,0 +1,93 @@
+import time
+from collections import deque
+import pytest
+from worker.src import llm_classifier
+from worker.src.circuit_breaker import CircuitBreaker
+
+class StubProvider:
+    """Провайдер с заданной задержкой и ответом вместо запроса к API."""
+
+    def __init__(self, name, delay=0.0, result=True, error=None, breaker=None):
+        self.name = name
+        self.delay = delay
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.breaker = breaker or CircuitBreaker(failure_threshold=5, recovery_timeout=60)
+
+    def request(self, text):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.result
+
+@pytest.fixture
+def setup(monkeypatch):
+    def install(*providers, deadline=2.0, latencies=()):
+        monkeypatch.setattr(llm_classifier, "providers", list(providers))
+        monkeypatch.setattr(llm_classifier, "LLM_DEADLINE", deadline)
+        monkeypatch.setattr(llm_classifier, "_latencies", deque(latencies, maxlen=llm_classifier.LLM_LATENCY_WINDOW))
+    return install
+
+def settle():
+    """Дает завершиться запросам, результат которых уже не нужен."""
+    time.sleep(0.5)
+
+def test_empty_text(setup):
+    primary = StubProvider("primary")
+    setup(primary)
+    assert llm_classifier.classify_with_llm("") is False
+    assert primary.calls == 0
+
+def test_primary_answer(setup):
+    primary = StubProvider("primary", result=True)
+    setup(primary)
+    assert llm_classifier.classify_with_llm("Продам диван") is True
+    settle()
+    assert primary.breaker.state == CircuitBreaker.CLOSED
+    assert len(llm_classifier._latencies) == 1
+
+def test_open_breaker_returns_none(setup):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+    breaker.record_failure()
+    primary = StubProvider("primary", breaker=breaker)
+    setup(primary)
+    assert llm_classifier.classify_with_llm("Продам диван") is None
+    assert primary.calls == 0
+    assert not llm_classifier.is_llm_available()
+
+def test_error_falls_back_to_hedge(setup):
+    primary = StubProvider("primary", error=RuntimeError("boom"))
+    hedge = StubProvider("hedge", result=False)
+    setup(primary, hedge)
+    assert llm_classifier.classify_with_llm("Продам диван") is False
+    settle()
+    assert primary.breaker.failures == 1
+    assert hedge.calls == 1
+
+def test_hedge_win_records_primary_probe(setup):
+    # Пробный запрос half_open проигрывает хеджированному, но его исход учитывается
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    primary = StubProvider("primary", delay=0.3, result=True, breaker=breaker)
+    hedge = StubProvider("hedge", result=False)
+    setup(primary, hedge, latencies=[0.05] * llm_classifier.LLM_HEDGE_MIN_SAMPLES)
+
+    assert llm_classifier.classify_with_llm("Продам диван") is False
+    assert hedge.calls == 1
+    settle()
+    assert primary.breaker.state == CircuitBreaker.CLOSED
+    # Задержка проигравшего основного запроса тоже попадает в статистику
+    assert max(llm_classifier._latencies) >= 0.3
+
+    primary.delay = 0.0
+    assert llm_classifier.classify_with_llm("Продам диван") is True
+    assert primary.calls == 2
+
+def test_late_answer_counts_as_failure(setup):
+    primary = StubProvider("primary", delay=0.3, result=True)
+    setup(primary, deadline=0.1)
+    assert llm_classifier.classify_with_llm("Продам диван") is None
+    settle()
+    assert primary.breaker.failures == 1
@@ -0,0 +1,36 @@
+from worker.src.replay import new_report, update_report, format_report
+
+def make_result(*records):
+    names = records[0]["predictions"]
+    return {"timings": {name: 0.1 for name in names}, "records": list(records)}
+
+def test_llm_errors_excluded_from_metrics_and_cost():
+    report = new_report(["nlp", "llm"])
+    update_report(report, make_result(
+        {"text": "Продам диван", "label": True, "predictions": {"nlp": True, "llm": True}},
+        {"text": "Продам шкаф", "label": True, "predictions": {"nlp": False, "llm": None}},
+    ), max_examples=5)
+
+    llm = report["classifiers"]["llm"]
+    assert llm["errors"] == 1
+    assert (llm["tp"], llm["fp"], llm["fn"], llm["tn"]) == (1, 0, 0, 0)
+    nlp = report["classifiers"]["nlp"]
+    assert (nlp["tp"], nlp["fn"]) == (1, 1)
+
+    # Токены считаются только для запроса, на который LLM ответила
+    answered_only = new_report(["nlp", "llm"])
+    update_report(answered_only, make_result(
+        {"text": "Продам диван", "label": True, "predictions": {"nlp": True, "llm": True}},
+    ), max_examples=5)
+    assert report["input_tokens"] == answered_only["input_tokens"]
+    assert report["output_tokens"] == answered_only["output_tokens"]
+
+def test_format_report_labels():
+    report = new_report(["llm"])
+    update_report(report, make_result(
+        {"text": "Продам диван", "label": None, "predictions": {"llm": False}},
+    ), max_examples=5)
+    text = format_report(report, elapsed=1.0, price_input=0.4, price_output=1.6)
+    assert "classifier time" in text
+    assert "cpu time" not in text
+    assert "upper bound" in text
@@ -0,0 +1,56 @@
+import threading
+import time
+
+class CircuitBreaker:
+    """
+    Простой предохранитель для внешнего сервиса.
+
+    closed    - запросы проходят, подряд идущие ошибки считаются;
+    open      - после failure_threshold ошибок подряд запросы не выполняются
+                в течение recovery_timeout секунд;
+    half_open - после паузы пропускается один пробный запрос: успех закрывает
+                предохранитель, ошибка снова открывает его.
+
+    Состояние хранится в памяти процесса воркера.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Можно ли выполнить запрос к сервису прямо сейчас."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                # Пропускаем один пробный запрос
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def is_available(self) -> bool:
+        """Закрыт ли предохранитель или истекла ли пауза (без изменения состояния)."""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.recovery_timeout
+            return self.state == self.CLOSED
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
@@ -0,0 +1,203 @@
+# Извлечение структурированных данных из объявлений: цена, валюта,
+# категория товара и нормализованные ключевые слова.
+# Пачки сообщений (backfill_extraction) обрабатываются векторизованными
+# строковыми операциями pandas, одно сообщение (process_message) -
+# заранее скомпилированными регулярными выражениями без накладных расходов pandas.
+
+from decimal import Decimal
+from typing import List, Optional
+import re
+import pandas as pd
+
+# Число: "50000", "50 000", "50.000", "1,500", "1 500,50", "1,5". Разделитель с ровно тремя
+# цифрами после него - разряды, с одной-двумя - дробная часть. Число не начинается и
+# не заканчивается внутри другого числа или слова ("ps5"). Разряды через пробел не
+# допускаются сразу после латинского слова: в "iphone 13 500 руб" 13 - номер модели,
+# цена - 500 (русские слова не мешают: "диван 15 000 руб" - 15000)
+GROUPED_AMOUNT = r"\d{1,3}(?:[ \u00a0.,]\d{3})+(?:[.,]\d{1,2})?"
+AMOUNT = (
+    rf"(?<!\w)(?P<amount>(?:(?<![a-z][ \u00a0])|(?=\d{{1,3}}[.,]\d{{3}})){GROUPED_AMOUNT}"
+    rf"|\d+(?:[.,]\d{{1,2}})?)(?!\d)"
+)
+# Разделители разрядов в найденной сумме
+THOUSANDS_SEPARATOR = r"[ \u00a0.,](?=\d{3}(?!\d))"
+# Множитель: "50к", "50 тыс", "1,5 млн"
+MULTIPLIER = r"(?P<multiplier>к|k|тыс\.?|млн\.?)"
+# Тысячи рублей одним обозначением: "150 т.р.", "150 тр" (валюта входит в обозначение)
+THOUSAND_RUB = r"(?P<multiplier>т\.\s?р(?![а-я])\.?|тр(?![а-я])\.?)"
+CURRENCY = r"(?P<currency>₽|руб(?:л[а-я]*|\b\.?)|р\.|р\b|rub|\$|usd|долл[а-я]*|€|eur|евро|₸|тенге|kzt)"
+
+# Шаблоны цены в порядке приоритета
+PRICE_PATTERNS = [
+    # "150 т.р.", "150 тр" (валюта по умолчанию - рубли)
+    rf"{AMOUNT}\s*{THOUSAND_RUB}",
+    # "50 000 руб", "50к ₽", "1,5 тыс. р."
+    rf"{AMOUNT}\s*{MULTIPLIER}?\s*{CURRENCY}",
+    # "$500", "€ 1 200"
+    rf"(?P<currency>\$|€)\s*{AMOUNT}\s*{MULTIPLIER}?",
+    # "цена: 50000", "цена 50к" (валюта по умолчанию)
+    rf"цен\w*\s*[:\-—]?\s*{AMOUNT}\s*{MULTIPLIER}?",
+]
+
+CURRENCY_CODES = {
+    "₽": "RUB", "руб": "RUB", "р": "RUB", "rub": "RUB",
+    "$": "USD", "usd": "USD", "долл": "USD",
+    "€": "EUR", "eur": "EUR", "евро": "EUR",
+    "₸": "KZT", "тенге": "KZT", "kzt": "KZT",
+}
+DEFAULT_CURRENCY = "RUB"
+# Множители по префиксу обозначения; остальные ("к", "тыс", "т.р.") - тысячи
+MULTIPLIER_VALUES = {"млн": 1_000_000}
+# Разумная верхняя граница цены (отсекает номера телефонов, артикулы и т.п.)
+MAX_PRICE = 10 ** 10
+
+# Нормализованное ключевое слово -> (категория, шаблон)
+KEYWORDS = {
+    "iphone": ("phone", r"iphone|айфон"),
+    "samsung": ("phone", r"samsung|самсунг"),
+    "xiaomi": ("phone", r"xiaomi|сяоми|redmi|редми"),
+    "phone": ("phone", r"смартфон|телефон"),
+    "macbook": ("laptop", r"macbook|макбук"),
+    "laptop": ("laptop", r"ноутбук|laptop"),
+    "ipad": ("tablet", r"ipad|айпад"),
+    "tablet": ("tablet", r"планшет"),
+    "headphones": ("electronics", r"наушник|airpods|эйрподс"),
+    "tv": ("electronics", r"телевизор"),
+    "console": ("electronics", r"playstation|ps[45]|xbox|nintendo"),
+    "car": ("auto", r"автомобил|машин[ау]"),
+    "tires": ("auto", r"\bшин[аы]|резин[ау]|колес[ао]"),
+    "apartment": ("realty", r"квартир"),
+    "room": ("realty", r"комнат[ау]"),
+    "sofa": ("furniture", r"диван"),
+    "wardrobe": ("furniture", r"шкаф"),
+    "bed": ("furniture", r"кроват"),
+    "stroller": ("kids", r"коляск"),
+    "toys": ("kids", r"игрушк"),
+    "sneakers": ("clothes", r"кроссовк"),
+    "jacket": ("clothes", r"куртк|пуховик"),
+    "bike": ("sport", r"велосипед|самокат"),
+}
+
+CATEGORIES = sorted({category for category, _ in KEYWORDS.values()})
+
+# Скомпилированные шаблоны для обработки одного сообщения
+_PRICE_REGEXES = [re.compile(pattern) for pattern in PRICE_PATTERNS]
+_KEYWORD_REGEXES = {keyword: re.compile(pattern) for keyword, (_, pattern) in KEYWORDS.items()}
+_THOUSANDS_SEPARATOR_REGEX = re.compile(THOUSANDS_SEPARATOR)
+
+def currency_code(raw: Optional[str]) -> str:
+    """Приводит обозначение валюты к ISO-коду."""
+    if not isinstance(raw, str):
+        return DEFAULT_CURRENCY
+    raw = raw.lower()
+    for prefix, code in CURRENCY_CODES.items():
+        if raw.startswith(prefix):
+            return code
+    return DEFAULT_CURRENCY
+
+def _extract_prices(texts: pd.Series) -> pd.DataFrame:
+    """Возвращает amount/multiplier/currency первой подходящей цены для каждого текста."""
+    result = pd.DataFrame(index=texts.index, columns=["amount", "multiplier", "currency"], dtype=object)
+
+    for pattern in PRICE_PATTERNS:
+        missing = result["amount"].isna()
+        if not missing.any():
+            break
+        found = texts[missing].str.extract(pattern)
+        for column in result.columns:
+            if column in found:
+                result.loc[missing, column] = found[column]
+
+    return result
+
+def multiplier_value(raw: Optional[str]) -> int:
+    """Возвращает числовое значение множителя ("к" -> 1000, "млн" -> 1000000)."""
+    if not isinstance(raw, str):
+        return 1
+    for prefix, value in MULTIPLIER_VALUES.items():
+        if raw.startswith(prefix):
+            return value
+    return 1000
+
+def _normalize_amounts(prices: pd.DataFrame) -> pd.Series:
+    """Переводит строковые суммы в числа с учетом разделителей и множителя."""
+    # "50 000" / "50.000" / "1,500" - разделители разрядов, "1,5" / "1.5" - дробная часть
+    amount = prices["amount"].astype("string").str.replace(THOUSANDS_SEPARATOR, "", regex=True)
+    amount = amount.str.replace(",", ".", regex=False)
+    values = pd.to_numeric(amount, errors="coerce")
+
+    return values * prices["multiplier"].map(multiplier_value).astype(float)
+
+def _normalize_amount(amount: str, multiplier: Optional[str]) -> float:
+    """Скалярный вариант _normalize_amounts для одного сообщения."""
+    amount = _THOUSANDS_SEPARATOR_REGEX.sub("", amount)
+    return float(amount.replace(",", ".")) * multiplier_value(multiplier)
+
+def _build_item(amount: Optional[float], currency: Optional[str], keywords: List[str]) -> dict:
+    """Формирует результат извлечения для одного сообщения."""
+    has_price = amount is not None and pd.notna(amount) and 0 < amount < MAX_PRICE
+    return {
+        "price": Decimal(str(round(float(amount), 2))) if has_price else None,
+        "currency": currency_code(currency) if has_price else None,
+        "category": KEYWORDS[keywords[0]][0] if keywords else None,
+        "keywords": keywords,
+    }
+
+def extract_item(text: Optional[str]) -> dict:
+    """
+    Извлекает цену, валюту, категорию и ключевые слова одного сообщения
+    (результат совпадает с extract_items([text])[0]).
+    """
+    text = (text or "").lower()
+    amount, currency = None, None
+
+    for regex in _PRICE_REGEXES:
+        match = regex.search(text)
+        if match:
+            groups = match.groupdict()
+            amount = _normalize_amount(groups["amount"], groups.get("multiplier"))
+            currency = groups.get("currency")
+            break
+
+    keywords = [keyword for keyword, regex in _KEYWORD_REGEXES.items() if regex.search(text)]
+    return _build_item(amount, currency, keywords)
+
+def extract_items(texts: List[Optional[str]]) -> List[dict]:
+    """
+    Извлекает цену, валюту, категорию и ключевые слова для пачки сообщений.
+    Возвращает список словарей с полями price, currency, category, keywords.
+    """
+    if not texts:
+        return []
+
+    series = pd.Series([text or "" for text in texts], dtype="string").str.lower()
+
+    prices = _extract_prices(series)
+    amounts = _normalize_amounts(prices)
+
+    matches = pd.DataFrame({
+        keyword: series.str.contains(pattern, regex=True, na=False)
+        for keyword, (_, pattern) in KEYWORDS.items()
+    })
+
+    return [
+        _build_item(
+            amounts.iloc[position],
+            prices.at[index, "currency"],
+            [keyword for keyword in KEYWORDS if matches.at[index, keyword]]
+        )
+        for position, index in enumerate(series.index)
+    ]
+
+def normalize_term(term: str) -> str:
+    """
+    Приводит поисковый термин пользователя к ключевому слову или категории
+    ("Айфон" -> "iphone"). Неизвестные термины возвращаются в нижнем регистре.
+    """
+    term = term.strip().lower()
+    if term in KEYWORDS or term in CATEGORIES:
+        return term
+    for keyword, (_, pattern) in KEYWORDS.items():
+        if re.search(pattern, term):
+            return keyword
+    return term
@@ -1,45 +1,183 @@
 from openai import OpenAI
 from dotenv import load_dotenv
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
+from typing import List, Optional
 import os
+import time
+from .circuit_breaker import CircuitBreaker
 
 load_dotenv()
 
-# Инициализация клиента OpenAI
-# Предполагается, что OPENAI_API_KEY установлен в .env
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    # base_url может быть изменен для других провайдеров (Groq, Mistral, Local)
-)
+LLM_MAX_TOKENS = 5
 
-def classify_with_llm(text: str) -> bool:
+# Общий дедлайн на классификацию одного сообщения (включая хеджированный запрос), секунды
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "10"))
+# Предохранитель: сколько ошибок подряд открывают его и через сколько секунд пробовать снова
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Хеджирование: второй запрос на альтернативный base_url, если первый дольше перцентиля задержки
+LLM_HEDGE_BASE_URL = os.getenv("LLM_HEDGE_BASE_URL") or None
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_LATENCY_WINDOW = 200
+
+class LLMProvider:
+    """OpenAI-совместимый провайдер со своим клиентом и предохранителем."""
+
+    def __init__(self, name: str, base_url: Optional[str] = None):
+        self.name = name
+        # Предполагается, что OPENAI_API_KEY установлен в .env;
+        # локальным OpenAI-совместимым эндпоинтам ключ обычно не нужен
+        self.client = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY") or ("local" if base_url else None),
+            # base_url может быть изменен для других провайдеров (Groq, Mistral, Local)
+            base_url=base_url,
+            timeout=LLM_DEADLINE,
+            # Повторы не нужны: ошибки учитывает предохранитель
+            max_retries=0
+        )
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN)
+
+    def request(self, text: str) -> bool:
+        response = self.client.chat.completions.create(
+            model=os.getenv("LLM_MODEL", "gpt-4.1-mini"),
+            messages=build_llm_messages(text),
+            temperature=0.0,
+            max_tokens=LLM_MAX_TOKENS
+        )
+
+        llm_response = response.choices[0].message.content.strip().lower()
+
+        return llm_response == "да"
+
+def build_providers(base_url: Optional[str] = None, hedge_base_url: Optional[str] = None) -> List[LLMProvider]:
+    """Основной провайдер и (необязательно) альтернативный для хеджированных запросов."""
+    result = [LLMProvider("primary", base_url)]
+    if hedge_base_url:
+        result.append(LLMProvider("hedge", hedge_base_url))
+    return result
+
+# Провайдеры создаются при первом запросе (см. get_providers), чтобы импорт
+# модуля не требовал ключа API; офлайн-прогон может подменить их заранее
+providers: Optional[List[LLMProvider]] = None
+
+def get_providers() -> List[LLMProvider]:
+    """Возвращает провайдеров, создавая их из настроек окружения при первом вызове."""
+    global providers
+    if providers is None:
+        providers = build_providers(os.getenv("LLM_BASE_URL") or None, LLM_HEDGE_BASE_URL)
+    return providers
+
+# Задержки успешных запросов к основному провайдеру, в том числе проигравших
+# хеджированному запросу (для порога хеджирования)
+_latencies = deque(maxlen=LLM_LATENCY_WINDOW)
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm")
+
+def build_llm_messages(text: str) -> list:
     """
-    Внешняя LLM-проверка: "Это сообщение является объявлением о продаже? Ответ: Да/Нет."
+    Формирует сообщения для LLM-запроса (используется также для оценки стоимости).
     """
-    if not text:
-        return False
-
     prompt = (
         "Проанализируй следующее сообщение. Является ли оно объявлением о продаже, "
         "покупке или обмене товаров/услуг? Ответь только 'Да' или 'Нет'."
         f"\n\nСообщение: \"{text}\""
     )
 
-    try:
-        response = client.chat.completions.create(
-            model=os.getenv("LLM_MODEL", "gpt-4.1-mini"),
-            messages=[
-                {"role": "system", "content": "Ты — высокоточный классификатор сообщений. Отвечай только 'Да' или 'Нет'."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.0,
-            max_tokens=5
-        )
-        
-        llm_response = response.choices[0].message.content.strip().lower()
-        
-        return llm_response == "да"
+    return [
+        {"role": "system", "content": "Ты — высокоточный классификатор сообщений. Отвечай только 'Да' или 'Нет'."},
+        {"role": "user", "content": prompt}
+    ]
+
+def hedge_delay() -> float:
+    """Через сколько секунд отправлять хеджированный запрос."""
+    if len(_latencies) < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_DEADLINE / 2
+    ordered = sorted(_latencies)
+    index = min(len(ordered) - 1, int(len(ordered) * LLM_HEDGE_PERCENTILE / 100))
+    return ordered[index]
+
+def is_llm_available() -> bool:
+    """Есть ли провайдер, к которому сейчас можно обратиться."""
+    return _has_available(get_providers())
 
-    except Exception as e:
-        print(f"Error during LLM classification: {e}")
-        # В случае ошибки LLM считаем, что это не продажа, чтобы избежать ложных срабатываний
+def _has_available(candidates: List[LLMProvider]) -> bool:
+    return any(provider.breaker.is_available() for provider in candidates)
+
+def _submit_next(pending: dict, candidates: List[LLMProvider], text: str, deadline: float) -> bool:
+    """Отправляет запрос следующему провайдеру, чей предохранитель пропускает запросы."""
+    while candidates:
+        provider = candidates.pop(0)
+        if provider.breaker.allow_request():
+            future = _executor.submit(provider.request, text)
+            # Исход запроса учитывается, даже если ответ уже не нужен (выиграл другой
+            # провайдер или истек дедлайн): иначе пробный запрос оставил бы
+            # предохранитель в half_open навсегда
+            future.add_done_callback(partial(_record_outcome, provider, time.monotonic(), deadline))
+            pending[future] = provider
+            return True
+    return False
+
+def _record_outcome(provider: LLMProvider, submitted_at: float, deadline: float, future: Future) -> None:
+    """Обновляет предохранитель провайдера и статистику задержек по завершенному запросу."""
+    finished_at = time.monotonic()
+    error = future.exception()
+    if error is not None:
+        print(f"Error during LLM classification ({provider.name}): {error}")
+        provider.breaker.record_failure()
+        return
+
+    if provider is get_providers()[0]:
+        # Учитываются и ответы, проигравшие хеджированному запросу
+        _latencies.append(finished_at - submitted_at)
+    if finished_at > deadline:
+        # Ответ пришел после дедлайна - для вызывающего это была ошибка
+        provider.breaker.record_failure()
+    else:
+        provider.breaker.record_success()
+
+def classify_with_llm(text: str) -> Optional[bool]:
+    """
+    Внешняя LLM-проверка: "Это сообщение является объявлением о продаже? Ответ: Да/Нет."
+    Возвращает None, если LLM недоступна (предохранитель открыт, ошибка или истек дедлайн) -
+    в этом случае результат должен считаться предварительным.
+    """
+    if not text:
         return False
+
+    deadline = time.monotonic() + LLM_DEADLINE
+    pending = {}
+    candidates = list(get_providers())
+    if not _submit_next(pending, candidates, text, deadline):
+        return None
+
+    # Пока есть альтернатива, первый запрос ждем не дольше порога хеджирования
+    wait_timeout = hedge_delay() if _has_available(candidates) else LLM_DEADLINE
+
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+
+        done, _ = wait(pending, timeout=min(wait_timeout, remaining), return_when=FIRST_COMPLETED)
+        wait_timeout = LLM_DEADLINE
+
+        if not done:
+            # Первый запрос медленнее перцентиля - отправляем хеджированный
+            _submit_next(pending, candidates, text, deadline)
+            continue
+
+        for future in done:
+            pending.pop(future)
+            if future.exception() is not None:
+                # Ошибку учел _record_outcome; пробуем следующего провайдера
+                if not pending:
+                    _submit_next(pending, candidates, text, deadline)
+                continue
+            return future.result()
+
+    # Дедлайн истек: незавершенные запросы будут учтены как ошибки по завершении
+    for provider in pending.values():
+        print(f"LLM classification deadline exceeded ({provider.name})")
+    return None
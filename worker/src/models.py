@@ -1,3 +1,3 @@
-from telegram_sales_parser.app.src.models import User, Chat, Message
+from telegram_sales_parser.app.src.models import User, Chat, Message, ChatDailyStats
 # Просто импортируем модели из app/src, чтобы не дублировать код.
 # В реальном проекте это был бы общий пакет.
@@ -0,0 +1,128 @@
+"""
+Компактная схема задачи process_message.
+
+Задача получает один словарь с короткими ключами, сериализуемый Celery в msgpack:
+    c  - Telegram ID чата
+    o  - Telegram ID владельца записи чата
+    m  - ID сообщения
+    a  - Telegram ID автора
+    d  - время сообщения (unix timestamp, секунды)
+    t  - текст сообщения (если он короткий)
+    r  - ключ Redis, по которому лежит длинный текст (вместо t)
+    f  - медиа: список [file_unique_id, file_id, размер в байтах, расширение]
+
+Если парсинг чата включили несколько владельцев, длинный текст кладется в Redis
+один раз на сообщение и переиспользуется всеми их задачами. Вместе с текстом
+хранится счетчик ссылок: последняя обработавшая задача удаляет ключ.
+"""
+from dotenv import load_dotenv
+from datetime import datetime
+from typing import List, Optional
+import os
+
+load_dotenv()
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = os.getenv("REDIS_PORT", "6379")
+TEXT_STORE_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/2"
+
+# Тексты длиннее этого порога (в байтах UTF-8) передаются по ссылке
+TEXT_INLINE_LIMIT = int(os.getenv("TEXT_INLINE_LIMIT", "512"))
+# Страховочное время жизни вынесенного текста, если задача так и не была обработана
+# (обычно ключ удаляется сразу после последней задачи)
+TEXT_TTL = int(os.getenv("TEXT_TTL", "86400"))
+
+class MissingTextError(RuntimeError):
+    """Текст сообщения по ссылке из payload не найден в Redis (истек TTL или удален)."""
+
+_redis_client = None
+
+def get_text_store():
+    """Возвращает (лениво создает) клиент Redis для хранения длинных текстов."""
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(TEXT_STORE_URL)
+    return _redis_client
+
+def store_large_text(chat_id: int, message_id: int, text: str, consumers: int) -> Optional[str]:
+    """
+    Сохраняет длинный текст в Redis для consumers задач и возвращает ключ.
+    Возвращает None (текст передается в задаче как есть), если текст короткий
+    или задача одна - тогда ссылка не экономит память, а только добавляет запрос к Redis.
+    """
+    if consumers <= 1 or len(text.encode("utf-8")) <= TEXT_INLINE_LIMIT:
+        return None
+
+    key = f"msgtext:{chat_id}:{message_id}"
+    pipeline = get_text_store().pipeline()
+    pipeline.set(key, text, ex=TEXT_TTL)
+    pipeline.set(f"{key}:refs", consumers, ex=TEXT_TTL)
+    pipeline.execute()
+    return key
+
+def build_task_payload(
+    chat_id: int,
+    owner_id: int,
+    message_id: int,
+    author_id: int,
+    timestamp: datetime,
+    text: str,
+    media_files: List[list],
+    text_ref: Optional[str] = None
+) -> dict:
+    """Формирует компактный payload задачи process_message."""
+    payload = {
+        "c": chat_id,
+        "o": owner_id,
+        "m": message_id,
+        "a": author_id,
+        "d": int(timestamp.timestamp()),
+    }
+    if text_ref:
+        payload["r"] = text_ref
+    elif text:
+        payload["t"] = text
+    if media_files:
+        payload["f"] = media_files
+    return payload
+
+def payload_repr(payload: dict) -> str:
+    """
+    Короткое представление payload для заголовка argsrepr задачи Celery.
+    По умолчанию Celery кладет туда repr аргументов (до 1024 символов текста
+    в каждой задаче), что занимает больше места в очереди, чем само тело.
+    """
+    return f"(<message c={payload['c']} m={payload['m']} o={payload['o']}>,)"
+
+def load_text(payload: dict) -> str:
+    """Возвращает текст сообщения (из payload или из Redis по ссылке)."""
+    if "r" not in payload:
+        return payload.get("t", "")
+
+    text = get_text_store().get(payload["r"])
+    if text is None:
+        raise MissingTextError(f"Text {payload['r']} expired or missing in Redis")
+    return text.decode("utf-8")
+
+def release_text(payload: dict) -> None:
+    """Уменьшает счетчик ссылок на вынесенный текст и удаляет его после последней задачи."""
+    if "r" not in payload:
+        return
+
+    key = payload["r"]
+    store = get_text_store()
+    if store.decr(f"{key}:refs") <= 0:
+        store.delete(key, f"{key}:refs")
+
+def load_media_files(payload: dict) -> List[dict]:
+    """Преобразует компактное описание медиа в формат save_media_files."""
+    return [
+        {
+            "file_unique_id": file_unique_id,
+            "file_id": file_id,
+            "file_size": file_size,
+            "file_extension": file_extension,
+        }
+        for file_unique_id, file_id, file_size, file_extension in payload.get("f", [])
+    ]
@@ -0,0 +1,207 @@
+"""
+Замер стоимости транспорта задач process_message: старый формат (JSON с полными
+именами полей, ISO-датой и словарями медиа) против компактного msgpack-payload.
+
+Считает полный размер сообщения в очереди - конверт Celery (заголовки, argsrepr/kwargsrepr,
+тело в base64) в том виде, в котором Redis-транспорт kombu кладет его в список, - плюс
+вынесенный в Redis текст, и время сериализации/десериализации тела на задачу.
+С --redis-url дополнительно ставит задачи в отдельную очередь и измеряет реальную
+память Redis на сообщение (MEMORY USAGE).
+
+Примеры запуска (из контейнера воркера):
+    python -m src.payload_bench --owners 3 --text-size 300
+    python -m src.payload_bench --owners 3 --text-size 2000 --redis-url redis://redis:6379/0
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import msgpack
+from celery import Celery
+from kombu.utils.json import dumps as kombu_dumps
+
+from .payload import TEXT_INLINE_LIMIT, build_task_payload, payload_repr
+
+BENCH_QUEUE = "payload-bench"
+TASK_NAME = "src.tasks.process_message"
+# Служебная часть тела задачи Celery (protocol 2): callbacks, errbacks, chain, chord
+EMBED = {"callbacks": None, "errbacks": None, "chain": None, "chord": None}
+
+def sample_message(text_size: int) -> dict:
+    """Типичное сообщение с фото."""
+    text = ("Продам iPhone 13 128Gb, состояние отличное, цена 50000 руб, торг. " * (text_size // 64 + 1))[:text_size]
+    return {
+        "chat_id": -1001234567890,
+        "message_id": 123456,
+        "author_id": 987654321,
+        "text": text,
+        "timestamp": datetime(2024, 5, 1, 12, 30, 45),
+        "media": {
+            "file_unique_id": "AQADBAADr6cxG1vLiUt-",
+            "file_id": "AgACAgIAAxkBAAIBZ2YyQk7p3mQ8q1dR5bq9l2kTnJqXAAJr2zEbvLiJSx3wq9yQ5mYtAQADAgADeQADNAQ",
+            "file_size": 184320,
+            "file_extension": ".jpg",
+        },
+    }
+
+def legacy_tasks(sample: dict, owners: int) -> List[tuple]:
+    """(args, kwargs) задач в старом формате: полный текст и ISO-дата в каждой задаче владельца."""
+    kwargs = {
+        "chat_id": sample["chat_id"],
+        "message_id": sample["message_id"],
+        "author_id": sample["author_id"],
+        "text": sample["text"],
+        "timestamp": sample["timestamp"].isoformat(),
+        "media_files": [{"file_id": sample["media"]["file_id"], "file_extension": sample["media"]["file_extension"]}],
+    }
+    return [((), kwargs) for _ in range(owners)]
+
+def uses_text_ref(sample: dict, owners: int) -> bool:
+    """Передается ли текст ссылкой (то же правило, что в store_large_text)."""
+    return owners > 1 and len(sample["text"].encode("utf-8")) > TEXT_INLINE_LIMIT
+
+def compact_tasks(sample: dict, owners: int) -> List[tuple]:
+    """(args, kwargs) задач в компактном формате."""
+    media = sample["media"]
+    text_ref = None
+    if uses_text_ref(sample, owners):
+        text_ref = f"msgtext:{sample['chat_id']}:{sample['message_id']}"
+
+    return [
+        ((build_task_payload(
+            chat_id=sample["chat_id"],
+            owner_id=100000 + owner,
+            message_id=sample["message_id"],
+            author_id=sample["author_id"],
+            timestamp=sample["timestamp"],
+            text=sample["text"],
+            media_files=[[media["file_unique_id"], media["file_id"], media["file_size"], media["file_extension"]]],
+            text_ref=text_ref
+        ),), {})
+        for owner in range(owners)
+    ]
+
+def task_options(args: tuple) -> dict:
+    """Опции постановки задачи как в боте: для компактного payload - короткий argsrepr."""
+    return {"argsrepr": payload_repr(args[0])} if args else {}
+
+def queued_bytes(tasks: List[tuple], serializer: str) -> int:
+    """
+    Размер сообщений в очереди: задачи ставятся через память (memory://), и каждое
+    сообщение сериализуется так же, как Redis-транспорт перед LPUSH.
+    """
+    app = Celery("payload_bench", broker="memory://")
+    app.conf.task_create_missing_queues = True
+    total = 0
+
+    with app.connection_for_write() as connection:
+        for args, kwargs in tasks:
+            app.send_task(TASK_NAME, args=args, kwargs=kwargs, queue=BENCH_QUEUE,
+                          serializer=serializer, connection=connection, **task_options(args))
+            total += len(kombu_dumps(connection.default_channel._get(BENCH_QUEUE)))
+
+    return total
+
+def measure(tasks: List[tuple], serializer: str, dumps: Callable, loads: Callable, iterations: int) -> dict:
+    """Размер сообщения в очереди и время (де)сериализации тела одной задачи."""
+    bodies = [(args, kwargs, EMBED) for args, kwargs in tasks]
+    encoded = [dumps(body) for body in bodies]
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for body in bodies:
+            dumps(body)
+    dumps_us = (time.perf_counter() - started) / (iterations * len(bodies)) * 1e6
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for data in encoded:
+            loads(data)
+    loads_us = (time.perf_counter() - started) / (iterations * len(bodies)) * 1e6
+
+    return {
+        "body_bytes": sum(len(data) for data in encoded),
+        "queued_bytes": queued_bytes(tasks, serializer),
+        "dumps_us": dumps_us,
+        "loads_us": loads_us,
+    }
+
+def measure_redis(redis_url: str, sample: dict, owners: int, count: int) -> dict:
+    """
+    Ставит count сообщений (по owners задач) в отдельную очередь в каждом формате
+    и возвращает среднюю память Redis на сообщение, включая вынесенный текст.
+    Очередь после замера удаляется.
+    """
+    import redis
+
+    client = redis.Redis.from_url(redis_url)
+    app = Celery("payload_bench", broker=redis_url)
+    app.conf.task_create_missing_queues = True
+    result = {}
+
+    formats = {
+        "legacy (json)": ("json", legacy_tasks(sample, owners)),
+        "compact (msgpack)": ("msgpack", compact_tasks(sample, owners)),
+    }
+
+    for name, (serializer, tasks) in formats.items():
+        client.delete(BENCH_QUEUE)
+        with app.connection_for_write() as connection:
+            for _ in range(count):
+                for args, kwargs in tasks:
+                    app.send_task(TASK_NAME, args=args, kwargs=kwargs, queue=BENCH_QUEUE,
+                                  serializer=serializer, connection=connection, **task_options(args))
+
+        memory = client.memory_usage(BENCH_QUEUE, samples=0) or 0
+        if serializer == "msgpack" and uses_text_ref(sample, owners):
+            # Текст и счетчик ссылок хранятся один раз на сообщение
+            key = f"{BENCH_QUEUE}:text"
+            client.set(key, sample["text"])
+            client.set(f"{key}:refs", owners)
+            text_memory = (client.memory_usage(key, samples=0) or 0) + (client.memory_usage(f"{key}:refs", samples=0) or 0)
+            memory += text_memory * count
+            client.delete(key, f"{key}:refs")
+        result[name] = memory / count
+
+    client.delete(BENCH_QUEUE)
+    return result
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="payload_bench", description="Celery task payload benchmark.")
+    parser.add_argument("--owners", type=int, default=3, help="Owners with parsing enabled for the chat")
+    parser.add_argument("--text-size", type=int, default=300, help="Message text length, characters")
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--redis-url", help="Measure real Redis memory in a scratch queue")
+    parser.add_argument("--redis-count", type=int, default=1000, help="Messages to enqueue per format")
+    args = parser.parse_args(argv)
+
+    sample = sample_message(args.text_size)
+    json_dumps = lambda body: json.dumps(body, ensure_ascii=False).encode("utf-8")
+    results = {
+        "legacy (json)": measure(
+            legacy_tasks(sample, args.owners), "json", json_dumps, json.loads, args.iterations
+        ),
+        "compact (msgpack)": measure(
+            compact_tasks(sample, args.owners), "msgpack", msgpack.packb, msgpack.unpackb, args.iterations
+        ),
+    }
+
+    print(f"Message: {args.text_size} chars of text, 1 photo, {args.owners} owner(s)")
+    text_bytes = len(sample["text"].encode("utf-8"))
+    if uses_text_ref(sample, args.owners):
+        print(f"Compact: text passed by reference, +{text_bytes} B stored once in Redis (not included in queued size)")
+    for name, stats in results.items():
+        print(
+            f"{name:18} body: {stats['body_bytes']} B/message, queued envelope: {stats['queued_bytes']} B/message, "
+            f"dumps: {stats['dumps_us']:.1f} us/task, loads: {stats['loads_us']:.1f} us/task"
+        )
+
+    if args.redis_url:
+        memory = measure_redis(args.redis_url, sample, args.owners, args.redis_count)
+        for name, per_message in memory.items():
+            print(f"Redis memory, {name}: {per_message:.0f} B/message (incl. stored text)")
+
+if __name__ == "__main__":
+    main()
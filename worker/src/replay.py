@@ -0,0 +1,366 @@
+"""
+Офлайн-прогон классификаторов по сохраненным сообщениям или размеченному корпусу.
+
+Позволяет оценить влияние изменений в classify_with_nlp / classify_with_llm
+до выкатки: скорость (сообщений/сек), точность и полноту относительно разметки,
+примеры расхождений и оценку стоимости LLM-запросов.
+
+Примеры запуска (из контейнера воркера):
+    python -m src.replay --jsonl corpus.jsonl --classifiers nlp,llm --workers 8
+    python -m src.replay --db --label-field llm_check --classifiers nlp --limit 100000
+    python -m src.replay fake-llm --port 8001 --latency-ms 50
+    python -m src.replay --jsonl corpus.jsonl --classifiers llm --llm-base-url http://localhost:8001/v1
+
+Формат JSONL: одна строка - один объект {"text": "...", "label": true/false}.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+CLASSIFIER_NAMES = ["nlp", "llm"]
+
+# Грубая оценка числа токенов: ~4 символа на токен
+CHARS_PER_TOKEN = 4
+
+# Классификаторы, загруженные в процессе пула
+_classifiers: Dict[str, callable] = {}
+
+# ----------------------------------------------------------------------
+# Источники данных
+# ----------------------------------------------------------------------
+
+def iter_jsonl(path: str) -> Iterator[dict]:
+    """Построчно читает размеченный корпус JSONL."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            label = item.get("label", item.get("is_sale"))
+            yield {"text": item.get("text") or "", "label": None if label is None else bool(label)}
+
+def iter_db_messages(label_field: Optional[str] = None, limit: Optional[int] = None) -> Iterator[dict]:
+    """
+    Потоково читает сохраненные сообщения из БД (без загрузки всей таблицы в память).
+    label_field - колонка Message, используемая как эталон (например, llm_check).
+    """
+    # Импорт здесь, чтобы прогон по JSONL не требовал подключения к БД
+    from sqlmodel import Session, select
+    from .db import engine
+    from .models import Message
+
+    columns = [Message.text]
+    if label_field:
+        columns.append(getattr(Message, label_field))
+
+    statement = select(*columns).order_by(Message.id).execution_options(yield_per=1000)
+    if label_field:
+        # У сообщений, ждущих LLM-проверки, llm_check и is_sale_message предварительные
+        statement = statement.where(Message.llm_pending == False)
+    if limit:
+        statement = statement.limit(limit)
+
+    with Session(engine) as session:
+        for row in session.execute(statement):
+            yield {"text": row[0] or "", "label": bool(row[1]) if label_field else None}
+
+def batched(records: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    """Разбивает поток записей на пачки фиксированного размера."""
+    iterator = iter(records)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+# ----------------------------------------------------------------------
+# Классификация в пуле процессов
+# ----------------------------------------------------------------------
+
+def load_classifier(name: str):
+    """Импортирует классификатор по имени (LLM-клиент создается только при необходимости)."""
+    if name == "nlp":
+        from .nlp_classifier import classify_with_nlp
+        return classify_with_nlp
+    if name == "llm":
+        from .llm_classifier import classify_with_llm
+        return classify_with_llm
+    raise ValueError(f"Unknown classifier: {name}")
+
+def _init_worker(names: List[str], llm_base_url: Optional[str]) -> None:
+    """Инициализирует процесс пула: загружает классификаторы и LLM-провайдер."""
+    if "llm" in names and llm_base_url:
+        from . import llm_classifier
+        llm_classifier.providers = llm_classifier.build_providers(llm_base_url)
+
+    for name in names:
+        _classifiers[name] = load_classifier(name)
+
+def classify_batch(batch: List[dict]) -> dict:
+    """
+    Прогоняет пачку сообщений через все выбранные классификаторы.
+    Возвращает предсказания и суммарное время вызовов каждого классификатора
+    (время по часам, включая ожидание ответа LLM, а не процессорное время).
+    """
+    timings = {name: 0.0 for name in _classifiers}
+    for record in batch:
+        predictions = {}
+        for name, classify in _classifiers.items():
+            started = time.perf_counter()
+            # None - LLM недоступна (ошибка, а не отрицательный ответ)
+            result = classify(record["text"])
+            predictions[name] = None if result is None else bool(result)
+            timings[name] += time.perf_counter() - started
+        record["predictions"] = predictions
+    return {"records": batch, "timings": timings}
+
+# ----------------------------------------------------------------------
+# Метрики и отчет
+# ----------------------------------------------------------------------
+
+def estimate_llm_tokens(text: str) -> tuple:
+    """
+    Оценивает число входных и выходных токенов одного LLM-запроса.
+    Выходные токены - верхняя граница (max_tokens): ответ "Да"/"Нет" обычно короче.
+    """
+    from .llm_classifier import build_llm_messages, LLM_MAX_TOKENS
+
+    if not text:
+        return 0, 0
+    chars = sum(len(message["content"]) for message in build_llm_messages(text))
+    return chars // CHARS_PER_TOKEN + 1, LLM_MAX_TOKENS
+
+def new_report(names: List[str]) -> dict:
+    """Создает пустой накопитель метрик."""
+    return {
+        "total": 0,
+        "labeled": 0,
+        "classifiers": {
+            name: {"tp": 0, "fp": 0, "fn": 0, "tn": 0, "positive": 0, "errors": 0, "seconds": 0.0}
+            for name in names
+        },
+        "disagreements": [],
+        "input_tokens": 0,
+        "output_tokens": 0,
+    }
+
+def update_report(report: dict, result: dict, max_examples: int) -> None:
+    """Добавляет результаты пачки в накопитель метрик."""
+    for name, seconds in result["timings"].items():
+        report["classifiers"][name]["seconds"] += seconds
+
+    for record in result["records"]:
+        report["total"] += 1
+        label = record["label"]
+        predictions = record["predictions"]
+        if label is not None:
+            report["labeled"] += 1
+
+        for name, predicted in predictions.items():
+            stats = report["classifiers"][name]
+            if predicted is None:
+                # Ответа нет - не учитываем в точности/полноте
+                stats["errors"] += 1
+                continue
+            stats["positive"] += int(predicted)
+            if label is None:
+                continue
+            if predicted and label:
+                stats["tp"] += 1
+            elif predicted:
+                stats["fp"] += 1
+            elif label:
+                stats["fn"] += 1
+            else:
+                stats["tn"] += 1
+
+        # Оплачиваются только запросы, на которые LLM ответила
+        if predictions.get("llm") is not None:
+            input_tokens, output_tokens = estimate_llm_tokens(record["text"])
+            report["input_tokens"] += input_tokens
+            report["output_tokens"] += output_tokens
+
+        answers = {value for value in predictions.values() if value is not None}
+        if label is not None:
+            answers.add(label)
+        if len(answers) > 1 and len(report["disagreements"]) < max_examples:
+            report["disagreements"].append(record)
+
+def format_report(report: dict, elapsed: float, price_input: float, price_output: float) -> str:
+    """Форматирует итоговый отчет прогона."""
+    lines = [
+        f"Messages: {report['total']} (labeled: {report['labeled']})",
+        f"Wall time: {elapsed:.2f}s, throughput: {report['total'] / elapsed if elapsed else 0:.1f} msg/s",
+        "",
+    ]
+
+    for name, stats in report["classifiers"].items():
+        line = (
+            f"[{name}] positive: {stats['positive']}, errors: {stats['errors']}, "
+            f"classifier time: {stats['seconds']:.2f}s "
+            f"({stats['seconds'] / report['total'] * 1000 if report['total'] else 0:.2f} ms/msg)"
+        )
+        if report["labeled"]:
+            predicted = stats["tp"] + stats["fp"]
+            actual = stats["tp"] + stats["fn"]
+            precision = stats["tp"] / predicted if predicted else 0.0
+            recall = stats["tp"] / actual if actual else 0.0
+            line += f", precision: {precision:.3f}, recall: {recall:.3f}"
+        lines.append(line)
+
+    if "llm" in report["classifiers"]:
+        cost = (report["input_tokens"] * price_input + report["output_tokens"] * price_output) / 1_000_000
+        lines.append(
+            f"[llm] estimated tokens: {report['input_tokens']} in / <= {report['output_tokens']} out "
+            f"(upper bound: max_tokens per answered request), estimated cost: <= ${cost:.4f}"
+        )
+
+    if report["disagreements"]:
+        lines.append("")
+        lines.append("Disagreement examples:")
+        for record in report["disagreements"]:
+            answers = ", ".join(f"{name}={value}" for name, value in record["predictions"].items())
+            text = record["text"].replace("\n", " ")[:120]
+            lines.append(f"  label={record['label']} {answers}: {text}")
+
+    return "\n".join(lines)
+
+def run_replay(
+    records: Iterable[dict],
+    names: List[str],
+    batch_size: int = 100,
+    workers: int = 4,
+    llm_base_url: Optional[str] = None,
+    max_examples: int = 10
+) -> tuple:
+    """
+    Прогоняет записи через классификаторы пачками в пуле процессов.
+    Возвращает накопитель метрик и время выполнения в секундах.
+    """
+    report = new_report(names)
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(names, llm_base_url)
+    ) as executor:
+        # Ограничиваем число пачек "в полете", чтобы не держать весь поток в памяти
+        pending = []
+        for batch in batched(records, batch_size):
+            pending.append(executor.submit(classify_batch, batch))
+            if len(pending) >= workers * 2:
+                update_report(report, pending.pop(0).result(), max_examples)
+        for future in pending:
+            update_report(report, future.result(), max_examples)
+
+    return report, time.perf_counter() - started
+
+# ----------------------------------------------------------------------
+# Локальный фейковый LLM-эндпоинт (OpenAI-совместимый)
+# ----------------------------------------------------------------------
+
+def serve_fake_llm(port: int, latency_ms: int) -> None:
+    """
+    Запускает OpenAI-совместимый эндпоинт /v1/chat/completions, который отвечает
+    решением NLP-классификатора с заданной задержкой. Нужен для замеров скорости
+    без расходов на реальный провайдер.
+    """
+    from .nlp_classifier import classify_with_nlp
+
+    class FakeLLMHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            content = body.get("messages", [{}])[-1].get("content", "")
+            # Классифицируем только текст сообщения, без формулировки промпта
+            content = content.split("Сообщение: ", 1)[-1].strip().strip('"')
+            time.sleep(latency_ms / 1000)
+
+            payload = json.dumps({
+                "id": "fake-completion",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "Да" if classify_with_nlp(content) else "Нет"},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 1, "total_tokens": 1}
+            }, ensure_ascii=False).encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), FakeLLMHandler)
+    print(f"Fake LLM endpoint listening on http://localhost:{port}/v1 (latency {latency_ms} ms)")
+    server.serve_forever()
+
+# ----------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------
+
+def main(argv: Optional[List[str]] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+
+    if argv and argv[0] == "fake-llm":
+        parser = argparse.ArgumentParser(prog="replay fake-llm", description="Local fake LLM endpoint.")
+        parser.add_argument("--port", type=int, default=8001)
+        parser.add_argument("--latency-ms", type=int, default=0)
+        args = parser.parse_args(argv[1:])
+        serve_fake_llm(args.port, args.latency_ms)
+        return
+
+    parser = argparse.ArgumentParser(prog="replay", description="Offline classifier replay harness.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--jsonl", help="Labeled JSONL corpus ({\"text\": ..., \"label\": ...} per line)")
+    source.add_argument("--db", action="store_true", help="Stream stored Message rows")
+    parser.add_argument("--label-field", choices=["is_sale_message", "nlp_check", "llm_check"],
+                        help="Message column used as reference label in --db mode")
+    parser.add_argument("--limit", type=int, help="Max number of Message rows in --db mode")
+    parser.add_argument("--classifiers", default="nlp", help="Comma-separated: nlp,llm")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--llm-base-url", help="Override LLM base_url (e.g. fake endpoint)")
+    parser.add_argument("--examples", type=int, default=10, help="Max disagreement examples to show")
+    parser.add_argument("--price-input", type=float, default=float(os.getenv("LLM_PRICE_INPUT", "0.4")),
+                        help="USD per 1M input tokens")
+    parser.add_argument("--price-output", type=float, default=float(os.getenv("LLM_PRICE_OUTPUT", "1.6")),
+                        help="USD per 1M output tokens")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.classifiers.split(",") if name.strip()]
+    unknown = set(names) - set(CLASSIFIER_NAMES)
+    if not names or unknown:
+        parser.error(f"Unknown classifiers: {', '.join(sorted(unknown)) or '(none)'}")
+
+    if args.jsonl:
+        records = iter_jsonl(args.jsonl)
+    else:
+        records = iter_db_messages(label_field=args.label_field, limit=args.limit)
+
+    report, elapsed = run_replay(
+        records,
+        names,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        llm_base_url=args.llm_base_url,
+        max_examples=args.examples
+    )
+    print(format_report(report, elapsed, args.price_input, args.price_output))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+from datetime import date, datetime, time
+from typing import Optional
+from sqlalchemy import select, update, func, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session
+from .models import Message, Chat, ChatDailyStats
+
+# Колонки-счетчики агрегированной таблицы
+COUNTER_COLUMNS = ["total_count", "sale_count", "nlp_count", "llm_count", "pending_count", "pending_sale_count"]
+KEY_COLUMNS = ["owner_id", "chat_id", "day"]
+
+def increment_daily_stats(
+    session: Session,
+    owner_id: int,
+    chat_id: int,
+    day: date,
+    is_sale_message: bool,
+    nlp_check: bool,
+    llm_check: bool,
+    llm_pending: bool = False
+) -> None:
+    """
+    Инкрементально обновляет дневную статистику чата (UPSERT).
+    Выполняется в той же транзакции, что и вставка сообщения.
+    """
+    _add_to_daily_stats(
+        session,
+        owner_id=owner_id,
+        chat_id=chat_id,
+        day=day,
+        total_count=1,
+        sale_count=int(is_sale_message),
+        nlp_count=int(nlp_check),
+        llm_count=int(llm_check),
+        pending_count=int(llm_pending),
+        pending_sale_count=int(llm_pending and is_sale_message)
+    )
+
+def adjust_daily_stats(
+    session: Session,
+    owner_id: int,
+    chat_id: int,
+    day: date,
+    sale_delta: int,
+    llm_delta: int,
+    pending_delta: int = 0,
+    pending_sale_delta: int = 0
+) -> None:
+    """
+    Корректирует дневную статистику после повторной классификации сообщения
+    (например, когда предварительный результат заменяется ответом LLM).
+    """
+    _add_to_daily_stats(
+        session,
+        owner_id=owner_id,
+        chat_id=chat_id,
+        day=day,
+        total_count=0,
+        sale_count=sale_delta,
+        nlp_count=0,
+        llm_count=llm_delta,
+        pending_count=pending_delta,
+        pending_sale_count=pending_sale_delta
+    )
+
+def _add_to_daily_stats(session: Session, **values) -> None:
+    """Прибавляет значения счетчиков к строке (владелец, чат, день), создавая ее при необходимости."""
+    statement = insert(ChatDailyStats).values(**values)
+    statement = statement.on_conflict_do_update(
+        index_elements=KEY_COLUMNS,
+        set_={
+            column: getattr(ChatDailyStats, column) + statement.excluded[column]
+            for column in COUNTER_COLUMNS
+        }
+    )
+    session.execute(statement)
+
+def refresh_daily_stats(session: Session, since: date, until: Optional[date] = None) -> None:
+    """
+    Пересчитывает дневную статистику по сообщениям за дни [since, until)
+    (без until - до текущего момента). Сканируется только диапазон индекса
+    Message.timestamp, а не вся таблица. Строки статистики за эти дни,
+    для которых сообщений больше нет (например, после удаления), обнуляются.
+    """
+    day_column = func.date(Message.timestamp)
+    period = [Message.timestamp >= datetime.combine(since, time.min)]
+    stats_period = [ChatDailyStats.day >= since]
+    if until:
+        period.append(Message.timestamp < datetime.combine(until, time.min))
+        stats_period.append(ChatDailyStats.day < until)
+
+    keys = (Chat.owner_id, Message.chat_id, day_column)
+    source = (
+        select(
+            *keys,
+            func.count(),
+            func.count().filter(Message.is_sale_message == True),
+            func.count().filter(Message.nlp_check == True),
+            func.count().filter(Message.llm_check == True),
+            func.count().filter(Message.llm_pending == True),
+            func.count().filter(Message.llm_pending == True, Message.is_sale_message == True)
+        )
+        .join(Chat, Chat.id == Message.chat_id)
+        .where(*period)
+        .group_by(*keys)
+    )
+
+    statement = insert(ChatDailyStats).from_select(KEY_COLUMNS + COUNTER_COLUMNS, source)
+    statement = statement.on_conflict_do_update(
+        index_elements=KEY_COLUMNS,
+        set_={column: statement.excluded[column] for column in COUNTER_COLUMNS}
+    )
+    session.execute(statement)
+
+    # Обнуляем ключи, которых нет в исходных данных
+    existing_keys = select(*keys).join(Chat, Chat.id == Message.chat_id).where(*period).distinct()
+    session.execute(
+        update(ChatDailyStats)
+        .where(
+            *stats_period,
+            tuple_(ChatDailyStats.owner_id, ChatDailyStats.chat_id, ChatDailyStats.day).not_in(existing_keys)
+        )
+        .values({column: 0 for column in COUNTER_COLUMNS})
+    )
+    session.commit()
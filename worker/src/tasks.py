@@ -1,12 +1,19 @@
 from celery import Celery
 from dotenv import load_dotenv
+from datetime import date, datetime, timedelta
+from typing import Optional
 import os
+import uuid
+from sqlalchemy import func
 from sqlmodel import Session, select
 from .db import engine
 from .models import Message, Chat
-from .llm_classifier import classify_with_llm
+from .llm_classifier import LLM_DEADLINE, classify_with_llm, is_llm_available
 from .nlp_classifier import classify_with_nlp
+from .extractor import extract_item, extract_items
 from .media_saver import save_media_files
+from .payload import load_text, load_media_files, release_text
+from .stats import increment_daily_stats, adjust_daily_stats, refresh_daily_stats
 
 load_dotenv()
 
@@ -22,41 +29,108 @@ celery_app = Celery(
     backend=CELERY_RESULT_BACKEND
 )
 
+# Компактный транспорт: payload задач сериализуется в msgpack,
+# результаты задач никто не читает - не храним их в Redis
+celery_app.conf.update(
+    task_serializer="msgpack",
+    accept_content=["msgpack"],
+    task_ignore_result=True,
+    result_expires=int(os.getenv("CELERY_RESULT_EXPIRES", "300")),
+)
+
+# Периодический пересчет агрегированной статистики (страховка от расхождений
+# инкрементальных счетчиков, например после ручного удаления сообщений)
+STATS_REFRESH_INTERVAL = int(os.getenv("STATS_REFRESH_INTERVAL", "900")) # секунды
+STATS_REFRESH_DAYS = int(os.getenv("STATS_REFRESH_DAYS", "2"))
+# Разовое заполнение статистики по всей истории - порциями по столько дней
+STATS_BACKFILL_CHUNK_DAYS = int(os.getenv("STATS_BACKFILL_CHUNK_DAYS", "30"))
+
+# Повторная LLM-проверка сообщений, классифицированных без LLM (предохранитель был открыт)
+LLM_RECLASSIFY_INTERVAL = int(os.getenv("LLM_RECLASSIFY_INTERVAL", "60")) # секунды
+LLM_RECLASSIFY_BATCH = int(os.getenv("LLM_RECLASSIFY_BATCH", "100"))
+# Заполнение цены/категории для сообщений, сохраненных до появления извлечения
+EXTRACTION_BACKFILL_BATCH = int(os.getenv("EXTRACTION_BACKFILL_BATCH", "1000"))
+
+celery_app.conf.beat_schedule = {
+    "refresh-daily-stats": {
+        "task": "src.tasks.refresh_stats",
+        "schedule": STATS_REFRESH_INTERVAL,
+    },
+    "reclassify-provisional": {
+        "task": "src.tasks.reclassify_provisional",
+        "schedule": LLM_RECLASSIFY_INTERVAL,
+        # Запуски, не начатые до следующего, не нужны
+        "options": {"expires": LLM_RECLASSIFY_INTERVAL},
+    },
+}
+
+_redis_client = None
+
+def acquire_lock(key: str, ttl: int) -> Optional[tuple]:
+    """
+    Захватывает блокировку в Redis брокера на ttl секунд.
+    Возвращает (ключ, токен) или None, если блокировку держит другой процесс.
+    """
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(CELERY_BROKER_URL)
+
+    token = uuid.uuid4().hex
+    if not _redis_client.set(key, token, nx=True, ex=ttl):
+        return None
+    return key, token
+
+def release_lock(key: str, token: str) -> None:
+    """Снимает блокировку, если она все еще принадлежит этому процессу."""
+    if _redis_client.get(key) == token.encode():
+        _redis_client.delete(key)
+
 @celery_app.task
-def process_message(
-    chat_id: int,
-    message_id: int,
-    author_id: int,
-    text: str,
-    timestamp: str,
-    media_files: list
-):
+def process_message(payload: dict):
     """
     Основная задача по обработке и классификации сообщения.
+    payload - компактный словарь, см. src/payload.py.
     """
-    print(f"Processing message {message_id} from chat {chat_id}...")
+    chat_id = payload["c"]
+    owner_id = payload["o"]
+    message_id = payload["m"]
+    author_id = payload["a"]
+    timestamp = datetime.utcfromtimestamp(payload["d"])
+    text = load_text(payload)
+
+    print(f"Processing message {message_id} from chat {chat_id} (Owner: {owner_id})...")
     
     with Session(engine) as session:
-        # Находим запись чата в нашей БД
-        chat_db = session.exec(select(Chat).where(Chat.telegram_chat_id == chat_id)).first()
+        # Находим запись чата этого владельца в нашей БД
+        chat_db = session.exec(select(Chat).where(
+            Chat.telegram_chat_id == chat_id,
+            Chat.owner_id == owner_id
+        )).first()
         
         if not chat_db:
-            print(f"Error: Chat with ID {chat_id} not found in DB.")
+            print(f"Error: Chat with ID {chat_id} (Owner: {owner_id}) not found in DB.")
+            release_text(payload)
             return False
 
         # 1. Сохранение медиа
-        # Получаем user_id владельца чата для изолированного хранения
-        owner_user_id = chat_db.owner_id
+        # user_id владельца чата используется для изолированного хранения
         media_path = save_media_files(
-            media_files=media_files,
-            user_id=owner_user_id,
+            media_files=load_media_files(payload),
+            user_id=owner_id,
             chat_id=chat_id,
             message_id=message_id
         )
         
-        # 2. Двойная классификация
+        # 2. Двойная классификация и извлечение цены/категории
         nlp_result = classify_with_nlp(text)
+        extracted = extract_item(text)
         llm_result = classify_with_llm(text)
+
+        # LLM недоступна: сохраняем предварительный результат NLP и ставим LLM-проверку в очередь
+        llm_pending = llm_result is None
+        if llm_pending:
+            llm_result = False
         
         is_sale_message = nlp_result or llm_result
         
@@ -70,10 +144,177 @@ def process_message(
             is_sale_message=is_sale_message,
             nlp_check=nlp_result,
             llm_check=llm_result,
-            media_path=media_path
+            llm_pending=llm_pending,
+            media_path=media_path,
+            **extracted
         )
         session.add(message)
+
+        # 4. Обновление агрегированной статистики в той же транзакции
+        increment_daily_stats(
+            session,
+            owner_id=owner_id,
+            chat_id=chat_db.id,
+            day=timestamp.date(),
+            is_sale_message=is_sale_message,
+            nlp_check=nlp_result,
+            llm_check=llm_result,
+            llm_pending=llm_pending
+        )
         session.commit()
-        print(f"Message {message_id} saved to DB. Sale: {is_sale_message}")
+        print(f"Message {message_id} saved to DB. Sale: {is_sale_message}{' (provisional)' if llm_pending else ''}")
+
+    # Текст больше не нужен этой задаче; при ошибке выше ключ остается до TTL
+    release_text(payload)
 
     return is_sale_message
+
+@celery_app.task
+def refresh_stats(days: int = STATS_REFRESH_DAYS):
+    """
+    Пересчитывает агрегированную статистику за последние days дней.
+    """
+    since = (datetime.utcnow() - timedelta(days=days)).date()
+
+    with Session(engine) as session:
+        refresh_daily_stats(session, since)
+
+    print(f"Daily stats refreshed since {since}")
+
+@celery_app.task
+def backfill_stats(since: Optional[str] = None, chunk_days: int = STATS_BACKFILL_CHUNK_DAYS):
+    """
+    Разово заполняет агрегированную статистику по всей истории сообщений.
+    Обрабатывает chunk_days дней начиная с since (ISO-дата; по умолчанию -
+    дата самого старого сообщения) и ставит себя в очередь со следующей порцией.
+    """
+    with Session(engine) as session:
+        if since is None:
+            first_timestamp = session.exec(select(func.min(Message.timestamp))).first()
+            if first_timestamp is None:
+                print("No messages to backfill daily stats")
+                return
+            start = first_timestamp.date()
+        else:
+            start = date.fromisoformat(since)
+
+        until = start + timedelta(days=chunk_days)
+        refresh_daily_stats(session, start, until)
+
+    print(f"Daily stats backfilled for {start} - {until - timedelta(days=1)}")
+    if until <= datetime.utcnow().date():
+        backfill_stats.delay(until.isoformat(), chunk_days)
+
+@celery_app.task
+def reclassify_provisional(batch_size: int = LLM_RECLASSIFY_BATCH):
+    """
+    Повторно классифицирует через LLM сообщения с предварительным результатом.
+    Ничего не делает, пока предохранитель LLM открыт; останавливается,
+    если провайдер снова стал недоступен.
+    LLM вызывается вне транзакции: блокировки сообщения и строки статистики
+    держатся только на время записи результата одного сообщения.
+    Одновременно выполняется только один запуск (блокировка в Redis): иначе
+    пересекающиеся запуски отправляли бы в LLM одни и те же сообщения.
+    """
+    if not is_llm_available():
+        return 0
+
+    # Пачка не может выполняться дольше batch_size дедлайнов LLM
+    lock = acquire_lock("lock:reclassify-provisional", int(batch_size * LLM_DEADLINE) + 60)
+    if not lock:
+        print("Reclassification is already running, skipping")
+        return 0
+
+    try:
+        return _reclassify_batch(batch_size)
+    finally:
+        release_lock(*lock)
+
+def _reclassify_batch(batch_size: int) -> int:
+    """Проверяет через LLM одну пачку сообщений с предварительным результатом."""
+    with Session(engine) as session:
+        candidates = session.exec(
+            select(Message.id, Message.text)
+            .where(Message.llm_pending == True)
+            .order_by(Message.id)
+            .limit(batch_size)
+        ).all()
+
+    reclassified = 0
+    for message_id, text in candidates:
+        llm_result = classify_with_llm(text)
+        if llm_result is None:
+            break
+        if _apply_llm_result(message_id, llm_result):
+            reclassified += 1
+
+    if reclassified:
+        print(f"Reclassified {reclassified} provisional messages with LLM")
+    return reclassified
+
+def _apply_llm_result(message_id: int, llm_result: bool) -> bool:
+    """
+    Записывает ответ LLM для сообщения с предварительным результатом в отдельной
+    короткой транзакции. Возвращает False, если сообщение уже не ждет проверки
+    (например, его обработал параллельный запуск задачи).
+    """
+    with Session(engine) as session:
+        row = session.exec(
+            select(Message, Chat.owner_id)
+            .join(Chat, Chat.id == Message.chat_id)
+            .where(Message.id == message_id, Message.llm_pending == True)
+            .with_for_update(of=Message)
+        ).first()
+        if not row:
+            return False
+
+        message, owner_id = row
+        is_sale_message = message.nlp_check or llm_result
+        adjust_daily_stats(
+            session,
+            owner_id=owner_id,
+            chat_id=message.chat_id,
+            day=message.timestamp.date(),
+            sale_delta=int(is_sale_message) - int(message.is_sale_message),
+            llm_delta=int(llm_result) - int(message.llm_check),
+            pending_delta=-1,
+            pending_sale_delta=-int(message.is_sale_message)
+        )
+
+        message.llm_check = llm_result
+        message.is_sale_message = is_sale_message
+        message.llm_pending = False
+        session.add(message)
+        session.commit()
+
+    return True
+
+@celery_app.task
+def backfill_extraction(after_id: int = 0, batch_size: int = EXTRACTION_BACKFILL_BATCH):
+    """
+    Извлекает цену, валюту и категорию для сообщений, у которых извлечение
+    еще не выполнялось (keywords IS NULL). Обрабатывает одну пачку по возрастанию id
+    и ставит себя в очередь снова, продолжая с последнего обработанного id.
+    """
+    with Session(engine) as session:
+        statement = (
+            select(Message)
+            .where(Message.id > after_id, Message.keywords == None)
+            .order_by(Message.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        messages = session.exec(statement).all()
+        last_id = messages[-1].id if messages else after_id
+
+        for message, extracted in zip(messages, extract_items([message.text for message in messages])):
+            for field, value in extracted.items():
+                setattr(message, field, value)
+            session.add(message)
+
+        session.commit()
+
+    print(f"Extraction backfilled for {len(messages)} messages (up to id {last_id})")
+    if len(messages) == batch_size:
+        backfill_extraction.delay(last_id, batch_size)
+    return len(messages)